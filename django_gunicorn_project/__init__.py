@@ -0,0 +1,4 @@
+from __future__ import absolute_import
+
+# Load the Celery app when Django starts so tasks use it.
+from .celery import app as celery_app
@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+
+import os
+import time
+
+from celery import Celery
+from celery.exceptions import TimeoutError
+from celery.signals import task_prerun
+from django.conf import settings
+
+from django_gunicorn_project import routers
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_gunicorn_project.settings")
+
+app = Celery('django_gunicorn_project')
+app.config_from_object('django.conf:settings')
+app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
+
+@task_prerun.connect
+def reset_pinning(**kwargs):
+    """
+    Start each task reading from the replicas, a worker runs many tasks in the same thread and a write in one of them
+    would otherwise send the reads of every later task to default.
+    """
+    routers.reset_pinning()
+
+@app.task
+def ping(sent):
+    """
+    Return the seconds between sending the task and a worker starting it.
+    """
+    return time.time() - sent
+
+def queue_stats(timeout=30):
+    """
+    Return the number of messages waiting in the default queue, the number of workers consuming from it and the
+    latency in seconds of a ping task sent now, which includes the time it waits behind the queued messages, or None
+    if no worker started it within timeout seconds.
+    """
+    queue = app.conf.CELERY_DEFAULT_QUEUE
+    depth = 0
+    with app.connection() as connection:
+        try:
+            depth = connection.default_channel.queue_declare(queue, passive=True)[1]
+        except connection.channel_errors:
+            # the queue is created with the first task sent, nothing is waiting yet
+            pass
+
+    # the Redis transport doesn't know about consumers, ask the workers which queues they consume from
+    active_queues = app.control.inspect(timeout=timeout / 10.0).active_queues() or {}
+    consumers = len([worker for worker, queues in active_queues.items() if queue in [q['name'] for q in queues]])
+
+    # the ping expires so it doesn't stay queued when no worker is running, and the latency is None then
+    try:
+        latency = ping.apply_async((time.time(),), expires=timeout).get(timeout=timeout)
+    except TimeoutError:
+        latency = None
+    return {'depth': depth, 'consumers': consumers, 'latency': latency}
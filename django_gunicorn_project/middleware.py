@@ -0,0 +1,64 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import connections
+
+from django_gunicorn_project import routers
+
+logger = logging.getLogger(__name__)
+
+class ReplicaPinningMiddleware(object):
+    """
+    Start each request reading from the replicas, unless the client wrote to the database in the last
+    REPLICA_PIN_SECONDS, so users see their own changes while the replicas catch up.
+    """
+
+    def process_request(self, request):
+        routers.reset_pinning()
+        if settings.REPLICA_PIN_COOKIE in request.COOKIES:
+            routers.pin_to_primary()
+
+    def process_response(self, request, response):
+        if routers.has_written():
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS)
+        return response
+
+class QueryCountMiddleware(object):
+    """
+    Count the queries each request runs on every database and log a warning when the same query with different
+    parameters runs QUERY_REPEAT_THRESHOLD times or more, which usually is an N+1 pattern that select_related or
+    prefetch_related would avoid. When DEBUG is on the total is also sent in the X-Query-Count header.
+    """
+
+    literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    lists = re.compile(r'\((?:\?, )+\?\)')
+
+    def process_request(self, request):
+        request._query_start = {}
+        for connection in connections.all():
+            # record queries even when DEBUG is off
+            connection.use_debug_cursor = True
+            request._query_start[connection.alias] = len(connection.queries)
+
+    def process_response(self, request, response):
+        start = getattr(request, '_query_start', None)
+        if start is None:
+            return response
+
+        total = 0
+        repeated = {}
+        for connection in connections.all():
+            queries = connection.queries[start.get(connection.alias, 0):]
+            total += len(queries)
+            for query in queries:
+                sql = self.lists.sub('(...)', self.literals.sub('?', query['sql']))
+                repeated[sql] = repeated.get(sql, 0) + 1
+
+        for sql, count in repeated.items():
+            if count >= settings.QUERY_REPEAT_THRESHOLD:
+                logger.warning('Query ran %s times in %s, possible N+1: %s', count, request.path, sql)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(total)
+        return response
@@ -0,0 +1 @@
+# No models, this module lets Django 1.4 find the tests of the project package.
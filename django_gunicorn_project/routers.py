@@ -0,0 +1,46 @@
+import random
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+
+def pin_to_primary():
+    """
+    Send every read from now on in this thread to the default database.
+    """
+    _state.pinned = True
+
+def reset_pinning():
+    _state.pinned = False
+    _state.wrote = False
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+class ReplicaRouter(object):
+    """
+    Send writes to default and spread reads among the aliases in DATABASE_REPLICAS.
+    After the first write reads go to default too, so they see what was just written instead of a replica that may
+    be behind. ReplicaPinningMiddleware resets this for each request and keeps it for the next few requests of a client.
+    """
+
+    def db_for_read(self, model, **hints):
+        if is_pinned() or not settings.DATABASE_REPLICAS:
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas are copies of default
+        return True
+
+    def allow_syncdb(self, db, model):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,60 @@
+"""
+Compare the database queries and time each session backend needs for a request that only reads the session and for
+one that changes it, the way SessionMiddleware loads and saves it. Run it from the project directory in the virtualenv:
+python -m django_gunicorn_project.session_benchmark
+"""
+import os
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_gunicorn_project.settings")
+
+from django.db import connections, reset_queries
+from django.utils.importlib import import_module
+
+ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.signed_cookies',
+)
+
+def measure(engine, requests=100):
+    """
+    Return the average queries and milliseconds per request for reading and for changing a session with engine.
+    """
+    SessionStore = import_module(engine).SessionStore
+    session = SessionStore()
+    session['counter'] = 0
+    session.save()
+    session_key = session.session_key
+
+    results = []
+    for write in (False, True):
+        reset_queries()
+        started = time.time()
+        for i in range(requests):
+            session = SessionStore(session_key)
+            counter = session['counter']
+            if write:
+                session['counter'] = counter + 1
+                session.save()
+                # signed cookies get a new key every time the data changes
+                session_key = session.session_key
+        elapsed = time.time() - started
+        queries = sum(len(connection.queries) for connection in connections.all())
+        results.append((float(queries) / requests, elapsed * 1000 / requests))
+
+    SessionStore(session_key).delete()
+    return results
+
+def main():
+    for connection in connections.all():
+        connection.use_debug_cursor = True
+
+    print '%-50s %14s %10s %14s %10s' % ('ENGINE', 'READ QUERIES', 'READ MS', 'WRITE QUERIES', 'WRITE MS')
+    for engine in ENGINES:
+        (read_queries, read_ms), (write_queries, write_ms) = measure(engine)
+        print '%-50s %14.1f %10.2f %14.1f %10.2f' % (engine, read_queries, read_ms, write_queries, write_ms)
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,16 @@ DATABASES = {
     }
 }
 
+# Aliases in DATABASES that are read replicas of default. Reads are spread among them and writes go to default,
+# see routers.py. After a write the client keeps reading from default for REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = ()
+DATABASE_ROUTERS = ['django_gunicorn_project.routers.ReplicaRouter']
+REPLICA_PIN_COOKIE = 'pin_primary_db'
+REPLICA_PIN_SECONDS = 15
+
+# Log a warning when a request runs the same query this many times, see QueryCountMiddleware.
+QUERY_REPEAT_THRESHOLD = 10
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -91,6 +101,8 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'django_gunicorn_project.middleware.QueryCountMiddleware',
+    'django_gunicorn_project.middleware.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -124,6 +136,18 @@ INSTALLED_APPS = (
     # 'django.contrib.admindocs',
 )
 
+# Celery task queue for work that shouldn't hold a gunicorn worker, see celery.py.
+# The fabfile sets BROKER_URL in local_settings.py for each environment so they don't share a queue.
+BROKER_URL = 'redis://localhost:6379/0'
+CELERY_RESULT_BACKEND = BROKER_URL
+CELERY_TASK_RESULT_EXPIRES = 3600
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+# slow tasks shouldn't sit behind others prefetched by a busy worker
+CELERYD_PREFETCH_MULTIPLIER = 1
+CELERY_ACKS_LATE = True
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
@@ -142,6 +166,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        # stderr ends up in the gunicorn log
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler'
         }
     },
     'loggers': {
@@ -150,6 +179,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'django_gunicorn_project': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': True,
+        },
     }
 }
 
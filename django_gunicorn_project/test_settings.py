@@ -0,0 +1,26 @@
+# Settings for the project tests, they run with SQLite and without Redis or memcached:
+# python manage.py test django_gunicorn_project --settings=django_gunicorn_project.test_settings
+from django_gunicorn_project.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'django_gunicorn_project.db',
+        # a file instead of the default in-memory database, so the replica connection opens the same one
+        'TEST_NAME': 'test_django_gunicorn_project.db',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'django_gunicorn_project.db',
+        'TEST_MIRROR': 'default',
+    },
+}
+DATABASE_REPLICAS = ('replica',)
+
+INSTALLED_APPS += ('django_gunicorn_project',)
+
+# tasks run in process with an in-memory broker and result backend
+BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+CELERY_ALWAYS_EAGER = True
+CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
@@ -0,0 +1,4 @@
+# Django 1.4 only collects the tests found in this module.
+from django_gunicorn_project.tests.systemd_units import *
+from django_gunicorn_project.tests.replicas import *
+from django_gunicorn_project.tests.health import *
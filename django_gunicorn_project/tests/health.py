@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase
+
+import fabfile
+
+class HealthParsingTest(SimpleTestCase):
+    """
+    wait_until_healthy keeps polling when curl's output can't be read instead of failing.
+    """
+
+    def test_parses_curl_output(self):
+        self.assertEqual(fabfile._parse_health('200 0.012'), ('200', 0.012))
+
+    def test_ignores_shell_banner(self):
+        self.assertEqual(fabfile._parse_health('Welcome to host\nLast login: today\n503 0.100'), ('503', 0.1))
+
+    def test_unreadable_output_is_not_healthy(self):
+        for output in ('', '200', 'Welcome to host'):
+            self.assertEqual(fabfile._parse_health(output), (None, None))
@@ -0,0 +1,93 @@
+import logging
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.http import HttpResponse
+from django.test import TransactionTestCase
+from django.test.client import RequestFactory
+
+from django_gunicorn_project import routers
+from django_gunicorn_project.celery import app
+from django_gunicorn_project.middleware import QueryCountMiddleware, ReplicaPinningMiddleware
+
+@app.task
+def read_alias():
+    return User.objects.all().db
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    The replica alias in test_settings mirrors default, so rows written to default can be read back from it.
+    """
+
+    def setUp(self):
+        routers.reset_pinning()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        routers.reset_pinning()
+
+    def test_reads_go_to_replica(self):
+        User.objects.create(username='reader')
+        routers.reset_pinning()
+
+        users = User.objects.filter(username='reader')
+        self.assertEqual(users.db, 'replica')
+        self.assertEqual(users.count(), 1)
+
+    def test_reads_go_to_default_after_write(self):
+        User.objects.create(username='writer')
+
+        self.assertTrue(routers.has_written())
+        self.assertEqual(User.objects.all().db, 'default')
+
+    def test_write_sets_pin_cookie(self):
+        middleware = ReplicaPinningMiddleware()
+        request = self.factory.post('/')
+        middleware.process_request(request)
+        User.objects.create(username='pinned')
+        response = middleware.process_response(request, HttpResponse())
+
+        cookie = response.cookies['pin_primary_db']
+        self.assertEqual(cookie['max-age'], 15)
+
+    def test_pin_cookie_reads_from_default(self):
+        middleware = ReplicaPinningMiddleware()
+        request = self.factory.get('/')
+        request.COOKIES['pin_primary_db'] = '1'
+        middleware.process_request(request)
+
+        self.assertEqual(User.objects.all().db, 'default')
+        response = middleware.process_response(request, HttpResponse())
+        self.assertNotIn('pin_primary_db', response.cookies)
+
+    def test_tasks_start_reading_from_replica(self):
+        routers.pin_to_primary()
+        self.assertEqual(read_alias.delay().get(), 'replica')
+
+    def test_repeated_query_is_logged(self):
+        User.objects.create(username='repeated')
+        handler = ListHandler()
+        logger = logging.getLogger('django_gunicorn_project.middleware')
+        logger.addHandler(handler)
+
+        middleware = QueryCountMiddleware()
+        request = self.factory.get('/users/')
+        middleware.process_request(request)
+        for i in range(10):
+            list(User.objects.filter(pk=i))
+        middleware.process_response(request, HttpResponse())
+
+        logger.removeHandler(handler)
+        for connection in connections.all():
+            connection.use_debug_cursor = None
+        self.assertEqual(len(handler.messages), 1)
+        self.assertIn('Query ran 10 times in /users/, possible N+1', handler.messages[0])
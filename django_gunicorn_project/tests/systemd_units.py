@@ -0,0 +1,88 @@
+import sys
+from StringIO import StringIO
+
+from django.test import SimpleTestCase
+
+import fabfile
+
+class SystemdUnitsTest(SimpleTestCase):
+    """
+    The systemd units are rendered and validated locally, these tests don't need a host.
+    """
+
+    def setUp(self):
+        self.projects = fabfile.build_projects_vars()
+
+    def test_units_render_and_validate(self):
+        for key, project in self.projects.items():
+            units = fabfile.render_systemd_worker_unit(project)
+            units.update(fabfile.render_systemd_slice(project))
+            for instance in project['instances']:
+                units.update(fabfile.render_systemd_units(instance))
+            for name, text in units.items():
+                self.assertEqual(fabfile.validate_systemd_unit(name, text), [])
+
+    def test_units_use_instance_values(self):
+        instance = self.projects['staging']['instances'][0]
+        units = fabfile.render_systemd_units(instance)
+
+        service = units['%(service)s.service' % instance]
+        self.assertIn('Requires=%(service)s.socket\n' % instance, service)
+        self.assertIn('ExecStart=/home/%(user)s/%(script_name)s\n' % instance, service)
+        self.assertIn('Nice=%(nice)s\n' % instance, service)
+
+        socket = units['%(service)s.socket' % instance]
+        self.assertIn('ListenStream=%(gunicorn_bind_address)s\n' % instance, socket)
+
+    def test_worker_unit_uses_environment_limits(self):
+        project = self.projects['staging']
+        worker = fabfile.render_systemd_worker_unit(project)['%(worker)s.service' % project]
+        self.assertIn('Slice=%(slice)s\n' % project, worker)
+        self.assertIn('IOSchedulingPriority=%(ionice_level)s\n' % project, worker)
+
+    def test_environment_shares_one_slice(self):
+        project = self.projects['production']
+        slice_unit = fabfile.render_systemd_slice(project)['%(slice)s' % project]
+        self.assertIn('CPUShares=%(cgroup_cpu_shares)s\n' % project, slice_unit)
+        self.assertIn('MemoryLimit=%(cgroup_memory_limit)s\n' % project, slice_unit)
+
+        units = fabfile.render_systemd_worker_unit(project)
+        for instance in project['instances']:
+            units.update(fabfile.render_systemd_units(instance))
+        for name, text in units.items():
+            if name.endswith('.service'):
+                self.assertIn('Slice=%(slice)s\n' % project, text)
+                self.assertNotIn('CPUShares', text)
+                self.assertNotIn('MemoryLimit', text)
+
+    def test_restart_limit_can_be_reached(self):
+        project = self.projects['production']
+        units = fabfile.render_systemd_worker_unit(project)
+        units.update(fabfile.render_systemd_units(project['instances'][0]))
+        for name, text in units.items():
+            if not name.endswith('.service'):
+                continue
+            values = dict(line.split('=', 1) for line in text.splitlines() if '=' in line and not line.startswith('#'))
+            restarts = int(values['StartLimitBurst']) * int(values['RestartSec'])
+            self.assertLess(restarts, int(values['StartLimitIntervalSec']), name)
+
+    def test_validate_reports_errors(self):
+        errors = fabfile.validate_systemd_unit('broken.service', 'Description=outside\n[Unit]\nno value\n[Bogus]\nExecStart=/home/user/django-project/run\n')
+        self.assertEqual(errors, [
+            "broken.service:1 'Description=outside' is outside of any section",
+            "broken.service:3 expected key=value, got 'no value'",
+            'broken.service:4 unknown section [Bogus]',
+            "broken.service:5 template placeholder left in 'ExecStart=/home/user/django-project/run'",
+            'broken.service missing Description in [Unit]',
+            'broken.service missing ExecStart in [Service]',
+        ])
+
+    def test_check_systemd_units(self):
+        # aborts, raising SystemExit, if any unit is invalid
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            fabfile.check_systemd_units('production', 'staging', 'development')
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn('==> django_gunicorn_project.socket <==', output)
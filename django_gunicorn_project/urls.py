@@ -5,6 +5,9 @@ from django.conf.urls import patterns, include, url
 # admin.autodiscover()
 
 urlpatterns = patterns('',
+    # Used by the fabfile to check gunicorn is answering after a start or restart.
+    url(r'^health/$', 'django_gunicorn_project.views.health', name='health'),
+
     # Examples:
     # url(r'^$', 'django_gunicorn_project.views.home', name='home'),
     # url(r'^django_gunicorn_project/', include('django_gunicorn_project.foo.urls')),
@@ -0,0 +1,7 @@
+from django.http import HttpResponse
+
+def health(request):
+    """
+    Lightweight view for readiness probes, it doesn't touch the database or the session.
+    """
+    return HttpResponse('ok', content_type='text/plain')
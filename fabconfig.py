@@ -50,9 +50,79 @@ PROJECT_GUNICORN_BIND_PORT_STAGING = '8001'
 
 PROJECT_GUNICORN_BIND_PORT_DEVELOPMENT = '8002'
 
+# Number of gunicorn instances for each environment, each with its own upstart job and port, balanced by an Nginx upstream.
+# Instance n binds to the environment port + n * PROJECT_GUNICORN_INSTANCE_PORT_STEP, so keep the step larger than the
+# number of environments sharing a host.
+PROJECT_GUNICORN_INSTANCES = 1
+PROJECT_GUNICORN_INSTANCES_STAGING = 1
+PROJECT_GUNICORN_INSTANCE_PORT_STEP = 10
+
+# Optional CPUs to pin each instance to with taskset, one entry per instance, for example ('0-1', '2-3').
+PROJECT_GUNICORN_CPU_AFFINITY = ()
+PROJECT_GUNICORN_CPU_AFFINITY_STAGING = ()
+
+# Balancing method for the Nginx upstream, least_conn requires Nginx >= 1.3.1. Leave empty for round robin.
+PROJECT_NGINX_UPSTREAM_METHOD = 'least_conn'
+
+# Resource limits for each environment so staging and development can share a host with production without starving it.
+# All gunicorn instances of an environment run in one cgroup named after it. CPU shares are relative weights, 1024 is
+# the kernel default. The memory limit takes values like 512M and needs the kernel booted with cgroup_enable=memory,
+# leave it empty for no limit. Leave both empty to not use a cgroup at all.
+# Nice goes from -20 to 19. The ionice class is 1 (realtime), 2 (best effort) or 3 (idle), with levels from 0 to 7.
+PROJECT_CGROUP_CPU_SHARES = 1024
+PROJECT_CGROUP_MEMORY_LIMIT = ''
+PROJECT_NICE = 0
+PROJECT_IONICE_CLASS = 2
+PROJECT_IONICE_LEVEL = 4
+
+PROJECT_CGROUP_CPU_SHARES_STAGING = 256
+PROJECT_CGROUP_MEMORY_LIMIT_STAGING = ''
+PROJECT_NICE_STAGING = 10
+PROJECT_IONICE_CLASS_STAGING = 2
+PROJECT_IONICE_LEVEL_STAGING = 7
+
+# Service manager used to run gunicorn, 'upstart' or 'systemd'. With systemd each instance gets a socket unit that keeps
+# listening while gunicorn restarts, which needs a gunicorn release that understands systemd's LISTEN_FDS. The limits
+# above are applied by the units instead of the run script, nice and ionice by each service and the CPU shares and
+# memory limit by a slice named after the environment that holds all its instances and its worker.
+# The watchdog restarts gunicorn when the health view stops answering for that many seconds, 0 to disable.
+PROJECT_SERVICE_MANAGER = 'upstart'
+PROJECT_SYSTEMD_WATCHDOG_SEC = 30
+
+# Celery worker for each environment, with its own broker database so environments sharing a host don't run each other's
+# tasks. The broker URL is written to local_settings.py by put_settings_files. Set the concurrency to 0 for no worker.
+PROJECT_BROKER_URL = 'redis://localhost:6379/0'
+PROJECT_BROKER_URL_STAGING = 'redis://localhost:6379/1'
+PROJECT_BROKER_URL_DEVELOPMENT = 'redis://localhost:6379/2'
+PROJECT_WORKER_CONCURRENCY = 2
+PROJECT_WORKER_CONCURRENCY_STAGING = 1
+PROJECT_WORKER_LOGLEVEL = 'info'
+
+# Session backend for each environment, written to local_settings.py by put_settings_files.
+# 'cache' and 'cached_db' need a cache shared by all the gunicorn processes of every web host. For them
+# put_settings_files writes a memcached CACHES at PROJECT_CACHE_LOCATION with the environment's project name as
+# KEY_PREFIX, so environments sharing the memcached server don't read each other's sessions, unless the settings file
+# already sets CACHES. With more than one web host the location must be a memcached server, or a list of them, that all
+# the hosts use, not the local 127.0.0.1 of each host.
+# 'signed_cookies' needs no storage but keeps the session data on the client. Compare them with benchmark_sessions.
+# Expired sessions are removed from the database by a cron job for the db backed ones, on this crontab schedule.
+PROJECT_SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+PROJECT_SESSION_ENGINE_STAGING = 'django.contrib.sessions.backends.db'
+PROJECT_SESSION_CLEANUP_SCHEDULE = '30 4 * * *'
+PROJECT_CACHE_LOCATION = '127.0.0.1:11211'
+
 PROJECT_LOG_GUNICORN = 'gunicorn.log'
 PROJECT_LOG_NGINX_ACCESS = 'nginx-access.log'
 PROJECT_LOG_NGINX_ERROR = 'nginx-error.log'
+PROJECT_LOG_WORKER = 'worker.log'
+PROJECT_LOG_STARTUP = 'startup.log' # seconds from service start to first healthy response
+
+# Readiness probe used by start_site and rolling_restart, requested through Nginx on each environment's ip:port.
+# A response only counts as healthy if it's a 200 answered within PROJECT_HEALTH_LATENCY seconds.
+PROJECT_HEALTH_URL = '/health/'
+PROJECT_HEALTH_LATENCY = 0.5
+PROJECT_HEALTH_INTERVAL = 1
+PROJECT_HEALTH_TIMEOUT = 60
 
 PROJECT_REPO_TYPE = 'git'
 PROJECT_REPO_URL = 'git@github.com:user/My-Project.git'
@@ -101,7 +171,11 @@ UBUNTU_PACKAGES=('man',
                  'postgresql-server-dev-9.1',
                  'postgresql-client-9.1',
                  'sqlite3',
-                 'python-dev'
+                 'python-dev',
+                 'curl',
+                 'cgroup-bin',
+                 'redis-server',
+                 'memcached'
                 )
 
 PIP_PACKAGES=('virtualenv',
@@ -114,6 +188,9 @@ PIP_VENV_PACKAGES=('psycopg2',
                    'yolk',
                    'Django==1.4',
                    'gunicorn',
+                   'celery==3.1.25',
+                   'redis',
+                   'python-memcached',
                    'Fabric',
                    'South',
                    'Sphinx',
@@ -122,4 +199,14 @@ PIP_VENV_PACKAGES=('psycopg2',
 
 MIRROR_URL = '-i http://d.pypi.python.org/simple'
 
+# Local directories, like deploy, are uploaded as one compressed tarball and extracted on the host.
+# With TRANSFER_DELTA a copy is kept in TRANSFER_CACHE_DIR and later uploads use rsync to send only the differences.
+TRANSFER_DELTA = True
+TRANSFER_CACHE_DIR = '/home/user/.deploy_cache'
+
+# OpenSSH multiplexing for the transfers that go through the ssh client, like rsync. The master connection stays open
+# for SSH_CONTROL_PERSIST after fab exits so the next run reuses it. Set SSH_CONTROL_PATH to '' to disable.
+SSH_CONTROL_PATH = '~/.ssh/fab-%r@%h:%p'
+SSH_CONTROL_PERSIST = '10m'
+
 #### END OF CONFIGURATION ####
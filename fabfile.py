@@ -22,6 +22,8 @@ $ fab -H user@host update_site:env=production,update_settings=y,upgrade_apps=y
 $ fab -H user@host start_site:env=production
 $ fab -H user@host stop_site:env=production
 $ fab -H user@host restart_site:env=production
+To restart gunicorn one environment and one host at a time, waiting for each to answer the health check.
+$ fab -H user@host1,user@host2 rolling_restart:production,staging
 
 6. Work on the development environment and use this to commit from time to time.
 
@@ -31,6 +33,11 @@ $ fab -H user@host commit:env=development,message='commit message and escaping c
 
 $ fab -H user@host quickstart:development,update_settings=y
 
+8. Add --set timings=y to any of the above to see how long starting fab, connecting and each task took,
+and how many connections were opened. Each host gets one connection that is reused by every task in the run.
+
+$ fab --set timings=y -H user@host restart_site:env=production
+
 Parameters:
 env: 'production', 'staging', 'development'.
 mirror: 'y', 'n'. Default: 'n'.
@@ -43,17 +50,88 @@ For more detailed instructions see README in The-Django-gunicorn-fabfile-project
 https://github.com/alexisbellido/The-Django-gunicorn-fabfile-project
 """
 
+import time
+_load_started = time.time()
+
 from fabric.api import run, sudo, hosts, settings, abort, warn, cd, local, put, get, env
 from fabric.contrib.files import exists, sed, comment, contains
 from fabric.contrib.files import append as fabappend
-from fabric.contrib.console import confirm
+from fabric.contrib.project import rsync_project
 from fabric.utils import warn
 from fabric.context_managers import hide
-from fabric.contrib import django
+from fabric.state import connections
 
-import string, random
+import os, sys, functools
+
+# Filled once per run by build_projects_vars, every task asks for the projects several times.
+_projects_cache = {}
+_timings = {'load': None, 'startup': None, 'depth': 0, 'connections': 0, 'handshake': 0.0}
+
+def _process_started():
+    """
+    Return when this fab process started, from /proc, or None where there's no /proc.
+    """
+    try:
+        uptime = float(open('/proc/uptime').read().split()[0])
+        stat = open('/proc/self/stat').read()
+    except IOError:
+        return None
+    # the command name in parentheses may have spaces, starttime is the 20th field after it, in clock ticks since boot
+    ticks = int(stat.rsplit(')', 1)[1].split()[19])
+    return time.time() - (uptime - ticks / float(os.sysconf('SC_CLK_TCK')))
+
+def _timed(func):
+    """
+    Print how long a task took when running with --set timings=y. The first timed task also reports how long fab took
+    to start, importing Fabric and paramiko and loading the fabfile, and, if it isn't open yet, how long it took to
+    connect to the current host. Without /proc only the fabfile itself is measured.
+    When the outermost task finishes the number of connections opened so far and the time spent opening them is printed.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if env.get('timings', 'n') != 'y':
+            return func(*args, **kwargs)
+
+        if _timings['load'] is not None:
+            if _timings['startup'] is not None:
+                print "[timings] startup: %(startup).3fs, of which loading the fabfile: %(load).3fs" % _timings
+            else:
+                print "[timings] load fabfile, without Fabric's imports: %(load).3fs" % _timings
+            _timings['load'] = None
+
+        if env.host_string and env.host_string not in connections:
+            started = time.time()
+            connections.connect(env.host_string)
+            handshake = time.time() - started
+            _timings['connections'] += 1
+            _timings['handshake'] += handshake
+            print "[timings] connect %s: %.3fs" % (env.host_string, handshake)
+
+        started = time.time()
+        _timings['depth'] += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _timings['depth'] -= 1
+            print "[timings] %s: %.3fs" % (func.__name__, time.time() - started)
+            if _timings['depth'] == 0:
+                print "[timings] %(connections)s connection(s) opened, %(handshake).3fs spent connecting" % _timings
+    return wrapper
+
+def ssh_options():
+    """
+    Options for the OpenSSH client used by rsync, sharing one master connection per host through SSH_CONTROL_PATH.
+    The master is kept open for SSH_CONTROL_PERSIST after the run, so consecutive fab invocations skip the handshake.
+    """
+    project_settings = get_settings()
+    if not project_settings.SSH_CONTROL_PATH:
+        return ''
+    return '-o ControlMaster=auto -o ControlPath=%s -o ControlPersist=%s' % (project_settings.SSH_CONTROL_PATH, project_settings.SSH_CONTROL_PERSIST)
 
 def build_projects_vars():
+    if _projects_cache:
+        return _projects_cache
+
     project_settings = get_settings()
     projects = {'production': {}, 'staging': {}, 'development': {}}
 
@@ -80,18 +158,61 @@ def build_projects_vars():
     projects['staging']['gunicorn_bind_port'] = project_settings.PROJECT_GUNICORN_BIND_PORT_STAGING
     projects['development']['gunicorn_bind_port'] = project_settings.PROJECT_GUNICORN_BIND_PORT_DEVELOPMENT
 
+    projects['production']['gunicorn_instances'] = project_settings.PROJECT_GUNICORN_INSTANCES
+    projects['staging']['gunicorn_instances'] = projects['development']['gunicorn_instances'] = project_settings.PROJECT_GUNICORN_INSTANCES_STAGING
+
+    projects['production']['gunicorn_cpu_affinity'] = project_settings.PROJECT_GUNICORN_CPU_AFFINITY
+    projects['staging']['gunicorn_cpu_affinity'] = projects['development']['gunicorn_cpu_affinity'] = project_settings.PROJECT_GUNICORN_CPU_AFFINITY_STAGING
+
+    projects['production']['cgroup_cpu_shares'] = project_settings.PROJECT_CGROUP_CPU_SHARES
+    projects['staging']['cgroup_cpu_shares'] = projects['development']['cgroup_cpu_shares'] = project_settings.PROJECT_CGROUP_CPU_SHARES_STAGING
+
+    projects['production']['cgroup_memory_limit'] = project_settings.PROJECT_CGROUP_MEMORY_LIMIT
+    projects['staging']['cgroup_memory_limit'] = projects['development']['cgroup_memory_limit'] = project_settings.PROJECT_CGROUP_MEMORY_LIMIT_STAGING
+
+    projects['production']['nice'] = project_settings.PROJECT_NICE
+    projects['staging']['nice'] = projects['development']['nice'] = project_settings.PROJECT_NICE_STAGING
+
+    projects['production']['ionice_class'] = project_settings.PROJECT_IONICE_CLASS
+    projects['staging']['ionice_class'] = projects['development']['ionice_class'] = project_settings.PROJECT_IONICE_CLASS_STAGING
+
+    projects['production']['ionice_level'] = project_settings.PROJECT_IONICE_LEVEL
+    projects['staging']['ionice_level'] = projects['development']['ionice_level'] = project_settings.PROJECT_IONICE_LEVEL_STAGING
+
+    projects['production']['broker_url'] = project_settings.PROJECT_BROKER_URL
+    projects['staging']['broker_url'] = project_settings.PROJECT_BROKER_URL_STAGING
+    projects['development']['broker_url'] = project_settings.PROJECT_BROKER_URL_DEVELOPMENT
+
+    projects['production']['session_engine'] = project_settings.PROJECT_SESSION_ENGINE
+    projects['staging']['session_engine'] = projects['development']['session_engine'] = project_settings.PROJECT_SESSION_ENGINE_STAGING
+
+    projects['production']['worker_concurrency'] = project_settings.PROJECT_WORKER_CONCURRENCY
+    projects['staging']['worker_concurrency'] = projects['development']['worker_concurrency'] = project_settings.PROJECT_WORKER_CONCURRENCY_STAGING
+
     for key in projects.keys():
         projects[key]['name'] = suffix(project_settings.PROJECT_NAME, key)
         projects[key]['descriptive_name'] = suffix(project_settings.PROJECT_DESCRIPTIVE_NAME, key)
         projects[key]['dir'] = suffix(project_settings.PROJECT_DIR, key)
         projects[key]['run-project'] = suffix('run-project', key)
         projects[key]['django-project'] = suffix('django-project', key)
+        projects[key]['run-worker'] = suffix('run-worker', key)
+        projects[key]['django-worker'] = suffix('django-worker', key)
+        projects[key]['worker'] = '%s_worker' % projects[key]['name']
+        projects[key]['worker_loglevel'] = project_settings.PROJECT_WORKER_LOGLEVEL
         projects[key]['logdir'] = suffix(project_settings.PROJECT_LOGDIR, key)
         projects[key]['log_gunicorn'] = project_settings.PROJECT_LOG_GUNICORN
         projects[key]['log_nginx_access'] = project_settings.PROJECT_LOG_NGINX_ACCESS
         projects[key]['log_nginx_error'] = project_settings.PROJECT_LOG_NGINX_ERROR
+        projects[key]['log_worker'] = project_settings.PROJECT_LOG_WORKER
+        projects[key]['log_startup'] = project_settings.PROJECT_LOG_STARTUP
         projects[key]['script_name'] = suffix(project_settings.PROJECT_SCRIPT_NAME, key)
+        projects[key]['worker_script_name'] = '%s_worker' % projects[key]['script_name']
         projects[key]['gunicorn_bind_address'] = '%s:%s' % (projects[key]['gunicorn_bind_ip'], projects[key]['gunicorn_bind_port'])
+        if projects[key]['cgroup_cpu_shares'] or projects[key]['cgroup_memory_limit']:
+            projects[key]['cgroup'] = projects[key]['name']
+        else:
+            projects[key]['cgroup'] = ''
+        projects[key]['slice'] = '%s.slice' % projects[key]['name']
 
         if key == 'production':
             projects[key]['ip'] = project_settings.PROJECT_NGINX_IP
@@ -105,7 +226,35 @@ def build_projects_vars():
             projects[key]['ip'] = project_settings.PROJECT_NGINX_IP_DEVELOPMENT
             projects[key]['port'] = project_settings.PROJECT_NGINX_PORT_DEVELOPMENT
 
-    return projects
+        projects[key]['instances'] = build_instances_vars(projects[key], project_settings.PROJECT_GUNICORN_INSTANCE_PORT_STEP)
+
+    _projects_cache.update(projects)
+    return _projects_cache
+
+def build_instances_vars(project, port_step):
+    """
+    Create a list with the variables for each gunicorn instance of an environment. Every instance is a copy of the
+    environment variables with its own service, script, port and CPU affinity. The first instance keeps the names used
+    by the environment so a single instance setup looks the same as before.
+    """
+    instances = []
+    for n in range(project['gunicorn_instances']):
+        instance = dict(project)
+        if n == 0:
+            instance['service'] = project['name']
+        else:
+            instance['service'] = '%s_%s' % (project['name'], n)
+            instance['descriptive_name'] = '%s %s' % (project['descriptive_name'], n)
+            for key in ('run-project', 'django-project', 'script_name'):
+                instance[key] = '%s_%s' % (project[key], n)
+        instance['gunicorn_bind_port'] = str(int(project['gunicorn_bind_port']) + n * port_step)
+        instance['gunicorn_bind_address'] = '%s:%s' % (instance['gunicorn_bind_ip'], instance['gunicorn_bind_port'])
+        if n < len(project['gunicorn_cpu_affinity']):
+            instance['cpu_affinity'] = project['gunicorn_cpu_affinity'][n]
+        else:
+            instance['cpu_affinity'] = ''
+        instances.append(instance)
+    return instances
 
 def build_parameters_list(projects, key):
     """
@@ -113,7 +262,6 @@ def build_parameters_list(projects, key):
     on the projects dictionary.
     """
     seq = []
-    projects = build_projects_vars()
     for project in projects.values():
         seq.append(project[key])
     return seq
@@ -130,6 +278,7 @@ def suffix(string, suffix, sep = '_'):
         suffixed = string + sep + suffix
     return suffixed
 
+@_timed
 def debug(x=''):
     """
     Simple debugging of some functions
@@ -138,16 +287,50 @@ def debug(x=''):
     print project_settings.EXTRA_APPS
 
 def get_settings():
-    import os
-    import sys
-
+    """
+    Import fabconfig, which Python keeps compiled and loaded for the rest of the run.
+    The project root is only added to sys.path the first time.
+    """
     root_dir = os.path.dirname(__file__)
-    sys.path.insert(0, root_dir)
+    if root_dir not in sys.path:
+        sys.path.insert(0, root_dir)
 
     import fabconfig
     return fabconfig
 
+@_timed
+def upload_tree(local_dir, remote_dir):
+    """
+    Upload the local directory local_dir into remote_dir in a single transfer.
+    If a previous copy exists on the host only the differences are sent with rsync, otherwise the directory is packed
+    into one compressed tarball that is uploaded and extracted remotely, instead of transferring file by file.
+    fab -H user@host upload_tree:deploy,/home/user/.deploy_cache
+    """
+    project_settings = get_settings()
+    local_dir = local_dir.rstrip('/')
+    name = os.path.basename(local_dir)
+
+    if project_settings.TRANSFER_DELTA and exists('%s/%s' % (remote_dir, name)):
+        rsync_project(remote_dir, local_dir, delete=True, ssh_opts=ssh_options())
+        return
+
+    import tempfile
+
+    handle, archive = tempfile.mkstemp(suffix='.tar.gz')
+    os.close(handle)
+    remote_archive = '/tmp/%s.tar.gz' % name
+    try:
+        local('tar czf %s -C %s %s' % (archive, os.path.dirname(os.path.abspath(local_dir)), name))
+        put(archive, remote_archive)
+        # start from an empty target so files removed locally don't survive in the previous copy
+        run('rm -rf %(dir)s/%(name)s && mkdir -p %(dir)s && tar xzf %(archive)s -C %(dir)s && rm %(archive)s' % {'dir': remote_dir, 'name': name, 'archive': remote_archive})
+    finally:
+        os.remove(archive)
+
+@_timed
 def add_user(user):
+    import string, random
+
     sudo('useradd %s -s /bin/bash -m' % user)
     sudo('echo "%s ALL=(ALL) ALL" >> /etc/sudoers' % user)
     password = ''.join(random.choice(string.ascii_uppercase + string.digits) for x in range(8))
@@ -205,16 +388,19 @@ def setup_django(*args, **kwargs):
             run('touch %s/%s' % (projects[key]['logdir'], projects[key]['log_gunicorn']))
             run('touch %s/%s' % (projects[key]['logdir'], projects[key]['log_nginx_access']))
             run('touch %s/%s' % (projects[key]['logdir'], projects[key]['log_nginx_error']))
+            run('touch %s/%s' % (projects[key]['logdir'], projects[key]['log_worker']))
 
         run('mkvirtualenv %s' % projects[key]['name'])
 
         for p in project_settings.PIP_VENV_PACKAGES:
             run('workon %s && pip install %s %s' % (projects[key]['name'], p, mirror_url))
 
+@_timed
 def put_settings_files(env='development'):
     """
     Only used when called explicitly, we don't want to change settings by default
     """
+    project_settings = get_settings()
     projects = build_projects_vars()
     project = projects[env]
     if exists('%(dir)s/%(inner_dir)s' % project):
@@ -222,6 +408,18 @@ def put_settings_files(env='development'):
         if env == 'production':
             with cd('%(dir)s/%(inner_dir)s' % project):
                 sed('local_settings.py', '^DEBUG = True$', 'DEBUG = False') 
+        # each environment uses its own broker so environments sharing a host don't run each other's tasks
+        fabappend('%(dir)s/%(inner_dir)s/local_settings.py' % project, ["BROKER_URL = '%(broker_url)s'" % project, 'CELERY_RESULT_BACKEND = BROKER_URL'])
+        fabappend('%(dir)s/%(inner_dir)s/local_settings.py' % project, "SESSION_ENGINE = '%(session_engine)s'" % project)
+        # without a shared cache every process has its own local memory cache and a session deleted on logout is
+        # still found by the others, one line because append skips lines already in the file
+        if project['session_engine'].endswith(('.cache', '.cached_db')):
+            if contains('%(dir)s/%(inner_dir)s/local_settings.py' % project, '^CACHES', escape=False):
+                warn("%(settings_path)s sets CACHES, make sure all the web hosts of %(name)s share it." % project)
+            else:
+                fabappend('%(dir)s/%(inner_dir)s/local_settings.py' % project, "CACHES = {'default': {'BACKEND': "
+                    "'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION': %r, 'KEY_PREFIX': '%s'}}"
+                    % (project_settings.PROJECT_CACHE_LOCATION, project['name']))
 
 # TODO revisit how the apps are committed and update from production, it may be safer using different
 # repositories or probably branches.
@@ -274,6 +472,7 @@ def update_project(env='development', update_settings='n'):
     if update_settings == 'y':
         put_settings_files(env)
 
+@_timed
 def put_config_files(*args):
     """
     Call with the names of the enviroments where you want to put the config files, for example:
@@ -283,7 +482,10 @@ def put_config_files(*args):
     sed('/etc/nginx/nginx.conf', '# types_hash_max_size.*', 'types_hash_max_size 2048;', use_sudo=True) 
     # fix for nginx: [emerg] could not build the server_names_hash, you should increase server_names_hash_bucket_size: 32
     sed('/etc/nginx/nginx.conf', '# server_names_hash_bucket_size.*', 'server_names_hash_bucket_size 64;', use_sudo=True) 
-    put('deploy', '/tmp/')
+    project_settings = get_settings()
+    # keep a pristine copy on the host so later runs only send what changed, then work on a scratch copy in /tmp
+    upload_tree('deploy', project_settings.TRANSFER_CACHE_DIR)
+    run('rm -rf /tmp/deploy && cp -r %s/deploy /tmp/' % project_settings.TRANSFER_CACHE_DIR)
     projects = build_projects_vars()
 
     for key in args:
@@ -294,9 +496,13 @@ def put_config_files(*args):
         with cd('/tmp/deploy/'):
             print "COPYING CONFIGURATION FILES FOR  %s..." % key
             if key != 'production':
-                run('cp run-project %(run-project)s' % projects[key])
                 run('cp etc/nginx/sites-available/django-project etc/nginx/sites-available/%(django-project)s' % projects[key])
-                run('cp etc/init/django-project.conf etc/init/%(django-project)s.conf' % projects[key])
+                run('cp run-worker %(run-worker)s' % projects[key])
+                run('cp etc/init/django-worker.conf etc/init/%(django-worker)s.conf' % projects[key])
+            for instance in projects[key]['instances']:
+                if instance['run-project'] != 'run-project':
+                    run('cp run-project %(run-project)s' % instance)
+                    run('cp etc/init/django-project.conf etc/init/%(django-project)s.conf' % instance)
 
     for key in args:
         """
@@ -304,43 +510,274 @@ def put_config_files(*args):
         """
         with cd('/tmp/deploy/'):
             print "SETTING UP CONFIGURATION FILES FOR %s..." % key
-            sed(projects[key]['run-project'], '^LOGFILE.*', 'LOGFILE=%(logdir)s/%(log_gunicorn)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^LOGLEVEL.*', 'LOGLEVEL=%(gunicorn_loglevel)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^NUM_WORKERS.*', 'NUM_WORKERS=%(gunicorn_num_workers)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^BIND_ADDRESS.*', 'BIND_ADDRESS=%(gunicorn_bind_ip)s:%(gunicorn_bind_port)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^USER.*', 'USER=%(user)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^GROUP.*', 'GROUP=%(user)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^PROJECTDIR.*', 'PROJECTDIR=%(dir)s' % projects[key]) 
-            sed(projects[key]['run-project'], '^PROJECTENV.*', 'PROJECTENV=/home/%(user)s/.virtualenvs/%(name)s' % projects[key]) 
+            for instance in projects[key]['instances']:
+                if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                    # systemd applies these from the service unit, and cgexec would move gunicorn out of the unit's cgroup
+                    instance = dict(instance, cgroup='', ionice_class='')
+                sed(instance['run-project'], '^LOGFILE.*', 'LOGFILE=%(logdir)s/%(log_gunicorn)s' % instance) 
+                sed(instance['run-project'], '^LOGLEVEL.*', 'LOGLEVEL=%(gunicorn_loglevel)s' % instance) 
+                sed(instance['run-project'], '^NUM_WORKERS.*', 'NUM_WORKERS=%(gunicorn_num_workers)s' % instance) 
+                sed(instance['run-project'], '^BIND_ADDRESS.*', 'BIND_ADDRESS=%(gunicorn_bind_address)s' % instance) 
+                sed(instance['run-project'], '^HEALTH_URL.*', 'HEALTH_URL=%s' % project_settings.PROJECT_HEALTH_URL) 
+                sed(instance['run-project'], '^CPU_AFFINITY.*', 'CPU_AFFINITY=%(cpu_affinity)s' % instance) 
+                sed(instance['run-project'], '^CGROUP=.*', 'CGROUP=%(cgroup)s' % instance) 
+                sed(instance['run-project'], '^CPU_SHARES.*', 'CPU_SHARES=%(cgroup_cpu_shares)s' % instance) 
+                sed(instance['run-project'], '^MEMORY_LIMIT.*', 'MEMORY_LIMIT=%(cgroup_memory_limit)s' % instance) 
+                sed(instance['run-project'], '^IONICE_CLASS.*', 'IONICE_CLASS=%(ionice_class)s' % instance) 
+                sed(instance['run-project'], '^IONICE_LEVEL.*', 'IONICE_LEVEL=%(ionice_level)s' % instance) 
+                sed(instance['run-project'], '^USER.*', 'USER=%(user)s' % instance) 
+                sed(instance['run-project'], '^GROUP.*', 'GROUP=%(user)s' % instance) 
+                sed(instance['run-project'], '^PROJECTDIR.*', 'PROJECTDIR=%(dir)s' % instance) 
+                sed(instance['run-project'], '^PROJECTENV.*', 'PROJECTENV=/home/%(user)s/.virtualenvs/%(name)s' % instance) 
+
+                sed('etc/init/%(django-project)s.conf' % instance, '^description.*', 'description "%(descriptive_name)s"' % instance) 
+                sed('etc/init/%(django-project)s.conf' % instance, '^nice.*', 'nice %(nice)s' % instance) 
+                sed('etc/init/%(django-project)s.conf' % instance, '^exec.*', 'exec /home/%(user)s/%(script_name)s' % instance) 
+
+            worker = projects[key]
+            if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                # systemd applies these from the service unit, and cgexec would move the worker out of the unit's cgroup
+                worker = dict(worker, cgroup='', ionice_class='')
+            sed(projects[key]['run-worker'], '^CGROUP=.*', 'CGROUP=%(cgroup)s' % worker) 
+            sed(projects[key]['run-worker'], '^CPU_SHARES.*', 'CPU_SHARES=%(cgroup_cpu_shares)s' % worker) 
+            sed(projects[key]['run-worker'], '^MEMORY_LIMIT.*', 'MEMORY_LIMIT=%(cgroup_memory_limit)s' % worker) 
+            sed(projects[key]['run-worker'], '^IONICE_CLASS.*', 'IONICE_CLASS=%(ionice_class)s' % worker) 
+            sed(projects[key]['run-worker'], '^IONICE_LEVEL.*', 'IONICE_LEVEL=%(ionice_level)s' % worker) 
+            sed(projects[key]['run-worker'], '^LOGFILE.*', 'LOGFILE=%(logdir)s/%(log_worker)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^LOGLEVEL.*', 'LOGLEVEL=%(worker_loglevel)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^CONCURRENCY.*', 'CONCURRENCY=%(worker_concurrency)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^APP.*', 'APP=%(inner_dir)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^USER.*', 'USER=%(user)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^GROUP.*', 'GROUP=%(user)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^PROJECTDIR.*', 'PROJECTDIR=%(dir)s' % projects[key]) 
+            sed(projects[key]['run-worker'], '^PROJECTENV.*', 'PROJECTENV=/home/%(user)s/.virtualenvs/%(name)s' % projects[key]) 
+
+            sed('etc/init/%(django-worker)s.conf' % projects[key], '^description.*', 'description "%(descriptive_name)s worker"' % projects[key]) 
+            sed('etc/init/%(django-worker)s.conf' % projects[key], '^nice.*', 'nice %(nice)s' % projects[key]) 
+            sed('etc/init/%(django-worker)s.conf' % projects[key], '^exec.*', 'exec /home/%(user)s/%(worker_script_name)s' % projects[key]) 
 
             # TODO figure out how to handle redirection from non-www to www versions passing the port, if needed.
+            servers = '\\n        '.join(['server %(gunicorn_bind_address)s;' % instance for instance in projects[key]['instances']])
+            if project_settings.PROJECT_NGINX_UPSTREAM_METHOD:
+                upstream_method = '%s;' % project_settings.PROJECT_NGINX_UPSTREAM_METHOD
+            else:
+                upstream_method = '# round robin'
+            sed('etc/nginx/sites-available/%(django-project)s' % projects[key], '^upstream.*', 'upstream %(name)s {' % projects[key]) 
+            sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'least_conn;', upstream_method) 
+            sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'server PROXY_IP_ADDRESS.*', servers) 
             sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'listen.*', 'listen %(ip)s:%(port)s;' % projects[key]) 
-            sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'proxy_pass http.*', 'proxy_pass http://%(gunicorn_bind_ip)s:%(gunicorn_bind_port)s/;' % projects[key]) 
+            sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'proxy_pass http.*', 'proxy_pass http://%(name)s/;' % projects[key]) 
             sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'example\.com', '%(domain)s' % projects[key]) 
             sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'root.*', 'root %(dir)s;' % projects[key]) 
             sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'access_log.*', 'access_log %(logdir)s/%(log_nginx_access)s;' % projects[key]) 
             sed('etc/nginx/sites-available/%(django-project)s' % projects[key], 'error_log.*', 'error_log %(logdir)s/%(log_nginx_error)s;' % projects[key]) 
 
-            sed('etc/init/%(django-project)s.conf' % projects[key], '^description.*', 'description "%(descriptive_name)s"' % projects[key]) 
-            sed('etc/init/%(django-project)s.conf' % projects[key], '^exec.*', 'exec /home/%(user)s/%(script_name)s' % projects[key]) 
-
             fix_venv_permission()
-            run('cp %(run-project)s /home/%(user)s/%(script_name)s' % projects[key])
-            run('chmod u+x /home/%(user)s/%(script_name)s' % projects[key]) 
+            if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                put_systemd_units(render_systemd_slice(projects[key]))
+            for instance in projects[key]['instances']:
+                run('cp %(run-project)s /home/%(user)s/%(script_name)s' % instance)
+                run('chmod u+x /home/%(user)s/%(script_name)s' % instance) 
+
+                if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                    put_systemd_units(render_systemd_units(instance))
+                else:
+                    sudo('cp etc/init/%(django-project)s.conf /etc/init/%(service)s.conf' % instance)
+
+                    if not exists('/etc/init.d/%(service)s' % instance):
+                    	sudo('ln -s /lib/init/upstart-job /etc/init.d/%(service)s' % instance)
+
+            if projects[key]['worker_concurrency']:
+                run('cp %(run-worker)s /home/%(user)s/%(worker_script_name)s' % projects[key])
+                run('chmod u+x /home/%(user)s/%(worker_script_name)s' % projects[key]) 
+
+                if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                    put_systemd_units(render_systemd_worker_unit(projects[key]))
+                else:
+                    sudo('cp etc/init/%(django-worker)s.conf /etc/init/%(worker)s.conf' % projects[key])
+
+                    if not exists('/etc/init.d/%(worker)s' % projects[key]):
+                    	sudo('ln -s /lib/init/upstart-job /etc/init.d/%(worker)s' % projects[key])
+
             sudo('cp etc/nginx/sites-available/%(django-project)s /etc/nginx/sites-available/%(name)s' % projects[key])
-            sudo('cp etc/init/%(django-project)s.conf /etc/init/%(name)s.conf' % projects[key])
 
             if not exists('/etc/nginx/sites-enabled/%(name)s' % projects[key]):
             	sudo('ln -s /etc/nginx/sites-available/%(name)s /etc/nginx/sites-enabled/%(name)s' % projects[key])
-            
-            if not exists('/etc/init.d/%(name)s' % projects[key]):
-            	sudo('ln -s /lib/init/upstart-job /etc/init.d/%(name)s' % projects[key])
+
+            put_session_cleanup(key)
 
     with settings(hide('warnings'), warn_only=True):
         fix_venv_permission()
         sudo('rm /etc/nginx/sites-enabled/default')
         run('rm -rf /tmp/deploy')
 
+def render_config(template, substitutions):
+    """
+    Render a template from the local deploy directory applying a list of (regex, replacement) pairs to each line,
+    the same way the sed calls do for the other configuration files, but without needing a connection.
+    """
+    import re
+
+    f = open(os.path.join(os.path.dirname(__file__), 'deploy', template))
+    try:
+        text = f.read()
+    finally:
+        f.close()
+
+    for before, after in substitutions:
+        text = re.sub(before, lambda match: after, text, flags=re.MULTILINE)
+    return text
+
+def render_systemd_units(instance):
+    """
+    Render the systemd service and socket units for a gunicorn instance.
+    Returns a dictionary with the unit file names as keys and their contents as values.
+    """
+    project_settings = get_settings()
+    watchdog = project_settings.PROJECT_SYSTEMD_WATCHDOG_SEC or ''
+
+    service = render_config('etc/systemd/system/django-project.service', [
+        ('^Description=.*', 'Description=%(descriptive_name)s' % instance),
+        ('^Requires=.*', 'Requires=%(service)s.socket' % instance),
+        ('^After=.*', 'After=network.target %(service)s.socket' % instance),
+        ('^ExecStart=.*', 'ExecStart=/home/%(user)s/%(script_name)s' % instance),
+        ('^WatchdogSec=.*', 'WatchdogSec=%s' % watchdog),
+        ('^Nice=.*', 'Nice=%(nice)s' % instance),
+        ('^IOSchedulingClass=.*', 'IOSchedulingClass=%(ionice_class)s' % instance),
+        ('^IOSchedulingPriority=.*', 'IOSchedulingPriority=%(ionice_level)s' % instance),
+        ('^Slice=.*', 'Slice=%(slice)s' % instance),
+    ])
+    socket = render_config('etc/systemd/system/django-project.socket', [
+        ('^Description=.*', 'Description=%(descriptive_name)s socket' % instance),
+        ('^ListenStream=.*', 'ListenStream=%(gunicorn_bind_address)s' % instance),
+    ])
+    return {'%(service)s.service' % instance: service, '%(service)s.socket' % instance: socket}
+
+def render_systemd_worker_unit(project):
+    """
+    Render the systemd service unit for the Celery worker of an environment.
+    Returns a dictionary with the unit file name as key and its contents as value.
+    """
+    service = render_config('etc/systemd/system/django-worker.service', [
+        ('^Description=.*', 'Description=%(descriptive_name)s worker' % project),
+        ('^ExecStart=.*', 'ExecStart=/home/%(user)s/%(worker_script_name)s' % project),
+        ('^Nice=.*', 'Nice=%(nice)s' % project),
+        ('^IOSchedulingClass=.*', 'IOSchedulingClass=%(ionice_class)s' % project),
+        ('^IOSchedulingPriority=.*', 'IOSchedulingPriority=%(ionice_level)s' % project),
+        ('^Slice=.*', 'Slice=%(slice)s' % project),
+    ])
+    return {'%(worker)s.service' % project: service}
+
+def render_systemd_slice(project):
+    """
+    Render the systemd slice of an environment, which carries the CPU and memory limits for all its units.
+    Returns a dictionary with the unit file name as key and its contents as value.
+    """
+    unit = render_config('etc/systemd/system/django-project.slice', [
+        ('^Description=.*', 'Description=%(descriptive_name)s slice' % project),
+        ('^CPUShares=.*', 'CPUShares=%(cgroup_cpu_shares)s' % project),
+        ('^MemoryLimit=.*', 'MemoryLimit=%(cgroup_memory_limit)s' % project),
+    ])
+    return {'%(slice)s' % project: unit}
+
+def validate_systemd_unit(name, text):
+    """
+    Check a rendered unit file without systemd: known sections, key=value lines, the keys each unit type needs
+    and no placeholders left from the template. Returns a list of errors, empty if the unit looks fine.
+    """
+    required = {
+        'service': (('Unit', 'Description'), ('Service', 'ExecStart')),
+        'socket': (('Unit', 'Description'), ('Socket', 'ListenStream')),
+        'slice': (('Unit', 'Description'),),
+    }
+    errors = []
+    section = None
+    found = set()
+
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        if line.startswith('['):
+            section = line.strip('[]')
+            if section not in ('Unit', 'Service', 'Socket', 'Slice', 'Install'):
+                errors.append('%s:%s unknown section [%s]' % (name, number, section))
+        elif '=' not in line:
+            errors.append('%s:%s expected key=value, got %r' % (name, number, line))
+        elif section is None:
+            errors.append('%s:%s %r is outside of any section' % (name, number, line))
+        else:
+            found.add((section, line.split('=', 1)[0].strip()))
+        if 'django-project' in line:
+            errors.append('%s:%s template placeholder left in %r' % (name, number, line))
+
+    for key in required.get(name.rsplit('.', 1)[-1], ()):
+        if key not in found:
+            errors.append('%s missing %s in [%s]' % (name, key[1], key[0]))
+    return errors
+
+def check_systemd_units(*args):
+    """
+    Render and validate the systemd units for the given environments locally, no host is needed, for example:
+    fab check_systemd_units:production,staging,development
+    """
+    projects = build_projects_vars()
+
+    errors = []
+    for key in args:
+        units = render_systemd_slice(projects[key])
+        for instance in projects[key]['instances']:
+            units.update(render_systemd_units(instance))
+        if projects[key]['worker_concurrency']:
+            units.update(render_systemd_worker_unit(projects[key]))
+
+        for name, text in sorted(units.items()):
+            print "==> %s <==\n%s" % (name, text)
+            errors.extend(validate_systemd_unit(name, text))
+    if errors:
+        abort('\n'.join(errors))
+
+def put_systemd_units(units):
+    """
+    Validate rendered systemd units, install them and enable them. The service of a gunicorn instance requires its
+    socket, so starting the service also starts the socket. Slices have nothing to enable, systemd starts them with
+    the first unit placed in them.
+    """
+    from StringIO import StringIO
+
+    for name, text in units.items():
+        errors = validate_systemd_unit(name, text)
+        if errors:
+            abort('\n'.join(errors))
+        put(StringIO(text), '/etc/systemd/system/%s' % name, use_sudo=True)
+
+    sudo('systemctl daemon-reload')
+    enable = [name for name in sorted(units) if not name.endswith('.slice')]
+    if enable:
+        sudo('systemctl enable %s' % ' '.join(enable))
+
+def put_session_cleanup(env='development', remove='n'):
+    """
+    Install a cron job for the project user that deletes expired sessions with manage.py cleanup, on the
+    PROJECT_SESSION_CLEANUP_SCHEDULE. Only database backed sessions need it, for other backends, or with remove=y,
+    the job is taken out of the crontab.
+    fab -H user@host put_session_cleanup:env=production
+    """
+    project_settings = get_settings()
+    projects = build_projects_vars()
+    project = projects[env]
+
+    tag = '# %(name)s session cleanup' % project
+    crontab = '/tmp/crontab.%(name)s' % project
+    with settings(hide('warnings'), warn_only=True):
+        run("crontab -l 2>/dev/null | grep -v '%s$' > %s" % (tag, crontab))
+    if remove != 'y' and project['session_engine'].endswith('db'):
+        job = '%s cd %s && /home/%s/.virtualenvs/%s/bin/python manage.py cleanup %s' % (project_settings.PROJECT_SESSION_CLEANUP_SCHEDULE,
+            project['dir'], project['user'], project['name'], tag)
+        run("echo '%s' >> %s" % (job, crontab))
+    run('crontab %s && rm %s' % (crontab, crontab))
+
+@_timed
 def clean(*args, **kwargs):
     """
     Clean before reinstalling. It can be called for multiple environments and there's an optional clean_nginx argument at the end.
@@ -354,9 +791,11 @@ def clean(*args, **kwargs):
         sudo('service nginx stop')
         for key in args:
             print "CLEANING CONFIGURATION FILES AND STOPPING SERVICES FOR %s..." % key
-            result = sudo('service %(name)s stop' % projects[key])
-            if result.failed:
-                warn( "%(name)s was not running." % projects[key])
+            sudo('service %(worker)s stop' % projects[key])
+            for instance in projects[key]['instances']:
+                result = sudo('service %(service)s stop' % instance)
+                if result.failed:
+                    warn( "%(service)s was not running." % instance)
 
             for app in project_settings.EXTRA_APPS:
                 run('workon %s && pip uninstall -y %s' % (projects[key]['name'], app['name']))
@@ -364,11 +803,32 @@ def clean(*args, **kwargs):
             sudo('rm -rf %(dir)s' % projects[key])
             sudo('rm -rf %(logdir)s' % projects[key])
             sudo('rmvirtualenv %(name)s' % projects[key])
-            sudo('rm /home/%(user)s/%(script_name)s' % projects[key])
+            sudo('rm /home/%(user)s/%(worker_script_name)s' % projects[key])
+            put_session_cleanup(key, remove='y')
+            if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                sudo('systemctl disable %(worker)s.service' % projects[key])
+                sudo('rm /etc/systemd/system/%(worker)s.service' % projects[key])
+            else:
+                sudo('rm /etc/init/%(worker)s.conf' % projects[key])
+                sudo('rm /etc/init.d/%(worker)s' % projects[key])
+            if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                sudo('rm /etc/systemd/system/%(slice)s' % projects[key])
+            elif projects[key]['cgroup']:
+                sudo('cgdelete -g cpu,cpuacct,memory:%(cgroup)s' % projects[key])
             sudo('rm /etc/nginx/sites-enabled/%(name)s' % projects[key])
             sudo('rm /etc/nginx/sites-available/%(name)s' % projects[key])
-            sudo('rm /etc/init/%(name)s.conf' % projects[key])
-            sudo('rm /etc/init.d/%(name)s' % projects[key])
+            for instance in projects[key]['instances']:
+                sudo('rm /home/%(user)s/%(script_name)s' % instance)
+                if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+                    sudo('systemctl stop %(service)s.socket' % instance)
+                    sudo('systemctl disable %(service)s.socket %(service)s.service' % instance)
+                    sudo('rm /etc/systemd/system/%(service)s.service /etc/systemd/system/%(service)s.socket' % instance)
+                else:
+                    sudo('rm /etc/init/%(service)s.conf' % instance)
+                    sudo('rm /etc/init.d/%(service)s' % instance)
+
+    # the cached deploy directory is shared by all environments, drop it so a reinstall uploads everything again
+    run('rm -rf %s' % project_settings.TRANSFER_CACHE_DIR)
 
     if kwargs.get('clean_nginx','n') == 'y':
         sed('/etc/nginx/nginx.conf', 'types_hash_max_size.*', '# types_hash_max_size 2048;', use_sudo=True) 
@@ -376,6 +836,7 @@ def clean(*args, **kwargs):
 
     fix_venv_permission()
 
+@_timed
 def quickstart(*args, **kwargs):
     """
     Run everything in one step, from empty server to running site.
@@ -385,6 +846,7 @@ def quickstart(*args, **kwargs):
     update_site(*args, **kwargs)
     restart_site(*args, **kwargs)
 
+@_timed
 def setup(*args, **kwargs):
     """
     Call with the names of the enviroments to setup and optionally add the mirror keyword argument.
@@ -396,6 +858,7 @@ def setup(*args, **kwargs):
     setup_django(*args, **kwargs)
     put_config_files(*args)
 
+@_timed
 def update_site(env='development', update_settings='n', upgrade_apps='n'):
     """
     Update files for the project and its companion apps.
@@ -403,34 +866,171 @@ def update_site(env='development', update_settings='n', upgrade_apps='n'):
     update_project(env, update_settings)
     update_apps(env, upgrade_apps)
 
+@_timed
 def start_site(env='development', **kwargs):
     sudo('service nginx start')
 
     projects = build_projects_vars()
     project = projects[env]
 
-    with settings(hide('warnings'), warn_only=True):
-        result = sudo('service %s start' % project['name'])
-    if result.failed:
-        warn( "%s already running." % project['name'])
+    for instance in project['instances']:
+        with settings(hide('warnings'), warn_only=True):
+            result = sudo('service %s start' % instance['service'])
+        if result.failed:
+            warn( "%s already running." % instance['service'])
+
+    if project['worker_concurrency']:
+        with settings(hide('warnings'), warn_only=True):
+            result = sudo('service %s start' % project['worker'])
+        if result.failed:
+            warn( "%s already running." % project['worker'])
 
+    wait_until_healthy(env)
     print "Site ready to rock at http://%s:%s" % (project['domain'], project['port'])
 
+@_timed
 def stop_site(env='development', **kwargs):
     sudo('service nginx stop')
 
     projects = build_projects_vars()
     project = projects[env]
 
-    with settings(hide('warnings'), warn_only=True):
-        result = sudo('service %s stop' % project['name'])
-    if result.failed:
-        warn( "%s was not running." % project['name'])
+    for instance in project['instances']:
+        with settings(hide('warnings'), warn_only=True):
+            result = sudo('service %s stop' % instance['service'])
+        if result.failed:
+            warn( "%s was not running." % instance['service'])
+
+    if project['worker_concurrency']:
+        with settings(hide('warnings'), warn_only=True):
+            result = sudo('service %s stop' % project['worker'])
+        if result.failed:
+            warn( "%s was not running." % project['worker'])
 
+@_timed
 def restart_site(env='development', **kwargs):
     stop_site(env)
     start_site(env)
 
+def _parse_health(output):
+    """
+    Return the status and latency curl wrote last in the output, which can start with anything the remote shell
+    prints, like a login banner. Returns (None, None) if the output doesn't end with them.
+    """
+    try:
+        status, latency = output.split()[-2:]
+        return status, float(latency)
+    except ValueError:
+        return None, None
+
+def wait_until_healthy(env='development', address=''):
+    """
+    Poll the health view through Nginx until it answers 200 within PROJECT_HEALTH_LATENCY seconds, aborting after
+    PROJECT_HEALTH_TIMEOUT seconds. The time to the first healthy response is appended to the startup log and returned.
+    Pass the ip:port of a gunicorn instance as address to check that instance directly instead of going through Nginx.
+    """
+    project_settings = get_settings()
+    projects = build_projects_vars()
+    project = projects[env]
+
+    if not address:
+        address = '%(ip)s:%(port)s' % project
+    url = 'http://%s%s' % (address, project_settings.PROJECT_HEALTH_URL)
+    started = time.time()
+    while True:
+        with settings(hide('running', 'stdout', 'warnings'), warn_only=True):
+            result = run("curl -s -o /dev/null -H 'Host: www.%s' -w '%%{http_code} %%{time_total}' %s" % (project['domain'], url))
+        if result.succeeded:
+            status, latency = _parse_health(result)
+            if status == '200' and latency <= project_settings.PROJECT_HEALTH_LATENCY:
+                break
+        if time.time() - started > project_settings.PROJECT_HEALTH_TIMEOUT:
+            abort("%s didn't answer %s within %s seconds." % (project['name'], url, project_settings.PROJECT_HEALTH_TIMEOUT))
+        time.sleep(project_settings.PROJECT_HEALTH_INTERVAL)
+
+    elapsed = time.time() - started
+    print "%s healthy at %s %.2f seconds after start." % (project['name'], address, elapsed)
+    run('echo "$(date --iso-8601=seconds) %s %.2f" >> %s/%s' % (address, elapsed, project['logdir'], project['log_startup']))
+    return elapsed
+
+@_timed
+def rolling_restart(*args):
+    """
+    Restart gunicorn for the given environments one at a time, moving on only after each answers the health check.
+    Nginx is left running so the other environments on the host keep serving. When an environment has several gunicorn
+    instances they are restarted one by one and each is checked directly, so Nginx always has some instance to send
+    requests to. Hosts are handled one after the other and a failed health check aborts the run before touching the next host.
+    fab -H user@host1,user@host2 rolling_restart:production,staging
+    """
+    projects = build_projects_vars()
+
+    for key in args:
+        print "RESTARTING %s..." % key
+        for instance in projects[key]['instances']:
+            with settings(hide('warnings'), warn_only=True):
+                result = sudo('service %(service)s restart' % instance)
+            if result.failed:
+                sudo('service %(service)s start' % instance)
+            if len(projects[key]['instances']) > 1:
+                wait_until_healthy(key, instance['gunicorn_bind_address'])
+        wait_until_healthy(key)
+
+@_timed
+def queue_status(env='development'):
+    """
+    Show how many tasks are waiting in the queue of an environment, how many workers consume from it and how long a
+    task sent now waits before a worker starts it.
+    fab -H user@host queue_status:env=production
+    """
+    projects = build_projects_vars()
+    project = projects[env]
+
+    with cd(project['dir']):
+        run('workon %(name)s && python -c "from %(inner_dir)s.celery import queue_stats; print queue_stats()"' % project)
+
+@_timed
+def benchmark_sessions(env='development'):
+    """
+    Compare the database queries and time per request of each session backend on an environment, using its database
+    and cache settings.
+    fab -H user@host benchmark_sessions:env=staging
+    """
+    projects = build_projects_vars()
+    project = projects[env]
+
+    with cd(project['dir']):
+        run('workon %(name)s && python -m %(inner_dir)s.session_benchmark' % project)
+
+@_timed
+def resource_usage(*args):
+    """
+    Show the CPU time and memory used by the cgroup of each environment, which is its slice under systemd, for example:
+    fab -H user@host resource_usage:production,staging,development
+    """
+    project_settings = get_settings()
+    projects = build_projects_vars()
+
+    print "%-40s %12s %12s %12s" % ('CGROUP', 'CPU SECONDS', 'MEMORY MB', 'PEAK MB')
+    for key in args:
+        if not projects[key]['cgroup']:
+            warn("%(name)s doesn't run with resource limits." % projects[key])
+            continue
+        if project_settings.PROJECT_SERVICE_MANAGER == 'systemd':
+            # the run scripts don't create the cgroup, systemd places the units in the slice instead
+            group = projects[key]['slice']
+        else:
+            group = projects[key]['cgroup']
+        with settings(hide('running', 'stdout', 'warnings'), warn_only=True):
+            result = run('for r in cpuacct.usage memory.usage_in_bytes memory.max_usage_in_bytes; do cgget -n -v -r $r %s 2>/dev/null || echo -; done' % group)
+        usage = result.split()
+        if usage[0] == '-':
+            warn("There's no cgroup for %(name)s, is it running?" % projects[key])
+            continue
+        cpu = '%.1f' % (int(usage[0]) / 1e9)
+        memory, peak = [value == '-' and value or '%.1f' % (int(value) / 1048576.0) for value in usage[1:]]
+        print "%-40s %12s %12s %12s" % (group, cpu, memory, peak)
+
+@_timed
 def commit(env='development', message='', push='n', test='y'):
     """
     Run tests, add, commit and push files for the project and extra apps.
@@ -463,6 +1063,7 @@ def commit(env='development', message='', push='n', test='y'):
                 local("cd %s && git push" % project['dir'])
         print "========================================================"
 
+@_timed
 def run_tests(env='development'):
     # TODO test on development, staging and production? I think so
     # TODO allow testing per app, use a parameter
@@ -472,9 +1073,15 @@ def run_tests(env='development'):
     with cd(project['dir']):
         run('workon %s && python manage.py test' % project['dir'])
 
+@_timed
 def deploy(env='development', update_settings='n', upgrade_apps='n'):
     """
     Run update the site and then restart it for the specified environment. Run after successful test and commit.
     """
     update_site(env, update_settings, upgrade_apps)
     restart_site(env)
+
+_timings['load'] = time.time() - _load_started
+_started = _process_started()
+if _started is not None:
+    _timings['startup'] = time.time() - _started
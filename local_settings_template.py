@@ -20,8 +20,19 @@ if DEBUG:
             'PASSWORD': '',                  # Not used with sqlite3.
             'HOST': '',                      # Set to empty string for localhost. Not used with sqlite3.
             'PORT': '',                      # Set to empty string for default. Not used with sqlite3.
-        }
+        },
+        # A second local database, like another sqlite3 file, can stand in for a replica.
+        # 'replica': {
+        #     'ENGINE': 'django.db.backends.',
+        #     'NAME': '',
+        #     'USER': '',
+        #     'PASSWORD': '',
+        #     'HOST': '',
+        #     'PORT': '',
+        #     'TEST_MIRROR': 'default',    # Tests read from default's test database through this alias.
+        # },
     }
+    DATABASE_REPLICAS = ()               # ('replica',) to send reads to the replica.
 else:
     DATABASES = {
         'default': {
@@ -31,8 +42,29 @@ else:
             'PASSWORD': '',                  # Not used with sqlite3.
             'HOST': '',                      # Set to empty string for localhost. Not used with sqlite3.
             'PORT': '',                      # Set to empty string for default. Not used with sqlite3.
-        }
+        },
+        # Read replicas of default, add as many as needed and list them in DATABASE_REPLICAS.
+        # 'replica1': {
+        #     'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        #     'NAME': '',
+        #     'USER': '',
+        #     'PASSWORD': '',
+        #     'HOST': '',
+        #     'PORT': '',
+        #     'TEST_MIRROR': 'default',
+        # },
     }
+    DATABASE_REPLICAS = ()               # ('replica1',) to send reads to the replica.
+
+# Shared cache for the cache and cached_db session backends, see PROJECT_SESSION_ENGINE in fabconfig.py.
+# put_settings_files appends one with the environment's KEY_PREFIX unless CACHES is set here, see PROJECT_CACHE_LOCATION.
+#CACHES = {
+#    'default': {
+#        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#        'LOCATION': '127.0.0.1:11211',
+#        'KEY_PREFIX': 'production',
+#    }
+#}
 
 STATIC_ROOT = ''
 STATIC_URL = '/static/'